@@ -18,13 +18,15 @@ User-Facing Labels:
 - Momentum: "Accelerating", "Steady", "Fading"
 """
 
+from collections import Counter
+import bottleneck as bn
 import pandas as pd
 import numpy as np
-from scipy import stats
 from config import (
     COMMODITIES, 
     RS_RATIO_PERIOD, 
     RS_MOMENTUM_PERIOD,
+    PERCENTILE_WINDOW,
     STRENGTH_LABELS,
     MOMENTUM_LABELS,
 )
@@ -48,58 +50,45 @@ def calculate_compass(prices_df: pd.DataFrame, tail_length: int = 5) -> dict:
     if len(prices_df) < min_days:
         raise ValueError(f"Need at least {min_days} days of data, got {len(prices_df)}")
     
+    # Work on a plain (dates x symbols) float64 array; labels are only needed
+    # again when building the output
+    symbols = list(prices_df.columns)
+    prices = prices_df.to_numpy(dtype=np.float64)
+    
     # =========================================================================
-    # STEP 1: Normalize all prices to starting point = 100
+    # STEP 1: Normalize all prices to the starting point (in log space)
     # =========================================================================
-    normalized = prices_df / prices_df.iloc[0] * 100
+    # log(price / first price); the usual x100 scaling cancels out of the
+    # RS ratio, so it is dropped. One log over the prices, then the first
+    # row is subtracted in place.
+    log_normalized = np.log(prices)
+    log_normalized -= log_normalized[0].copy()
     
     # =========================================================================
     # STEP 2: Create equal-weight benchmark (geometric mean)
     # =========================================================================
-    log_prices = np.log(normalized)
-    benchmark_log = log_prices.mean(axis=1)
-    benchmark = np.exp(benchmark_log) * 100 / np.exp(benchmark_log.iloc[0])
+    benchmark_log = np.nanmean(log_normalized, axis=1, keepdims=True)
     
     # =========================================================================
     # STEP 3: Calculate Relative Strength (RS) for each asset
     # =========================================================================
-    rs = normalized.div(benchmark, axis=0)
+    # RS = normalized price / benchmark = exp(log difference), computed in the
+    # same buffer
+    rs = log_normalized
+    rs -= benchmark_log
+    np.exp(rs, out=rs)
     
     # =========================================================================
     # STEP 4: Calculate RS-Ratio using percentile ranks
     # =========================================================================
     # Smooth the RS first
-    rs_smoothed = rs.rolling(RS_RATIO_PERIOD).mean()
+    rs_smoothed = bn.move_mean(rs, window=RS_RATIO_PERIOD, axis=0)
     
-    # Calculate percentile rank over available history for each asset
+    # Calculate percentile rank over the trailing window for each asset
     # This gives us "what % of historical values are below current value"
-    def rolling_percentile_rank(series, window=None):
-        """Calculate rolling percentile rank (0-100)
-        
-        If window is None, use all available history (expanding window).
-        """
-        result = pd.Series(index=series.index, dtype=float)
-        min_periods = 50  # Minimum data points needed for meaningful percentile
-        
-        for i in range(min_periods, len(series)):
-            if window is None:
-                # Expanding window - use all history up to this point
-                window_data = series.iloc[:i]
-            else:
-                # Fixed rolling window
-                start = max(0, i - window)
-                window_data = series.iloc[start:i]
-            
-            current = series.iloc[i]
-            # Percentile rank: % of values below current
-            rank = (window_data < current).sum() / len(window_data) * 100
-            result.iloc[i] = rank
-        return result
-    
-    # Apply percentile ranking to smoothed RS (use expanding window)
-    rs_ratio_pct = pd.DataFrame(index=rs_smoothed.index, columns=rs_smoothed.columns)
-    for col in rs_smoothed.columns:
-        rs_ratio_pct[col] = rolling_percentile_rank(rs_smoothed[col], window=None)
+    # Only the shown dates are ranked: the tail, and always the current row
+    n_ranked = max(tail_length, 1)
+    rs_ratio_pct = _percentile_rank(rs_smoothed, n_ranked, window=PERCENTILE_WINDOW)
     
     # Rescale: 50th percentile -> 100, so range is roughly 50-150
     rs_ratio_display = rs_ratio_pct + 50  # Now 0th pct = 50, 50th pct = 100, 100th pct = 150
@@ -108,12 +97,15 @@ def calculate_compass(prices_df: pd.DataFrame, tail_length: int = 5) -> dict:
     # STEP 5: Calculate RS-Momentum using percentile ranks
     # =========================================================================
     # Rate of change of the smoothed RS
-    rs_roc = rs_smoothed.pct_change(periods=RS_MOMENTUM_PERIOD) * 100
+    # Written in place into one buffer; the first RS_MOMENTUM_PERIOD rows stay NaN
+    rs_roc = np.full_like(rs_smoothed, np.nan)
+    roc = rs_roc[RS_MOMENTUM_PERIOD:]
+    np.divide(rs_smoothed[RS_MOMENTUM_PERIOD:], rs_smoothed[:-RS_MOMENTUM_PERIOD], out=roc)
+    roc -= 1
+    roc *= 100
     
-    # Percentile rank the rate of change (use expanding window)
-    rs_momentum_pct = pd.DataFrame(index=rs_roc.index, columns=rs_roc.columns)
-    for col in rs_roc.columns:
-        rs_momentum_pct[col] = rolling_percentile_rank(rs_roc[col], window=None)
+    # Percentile rank the rate of change (same trailing window)
+    rs_momentum_pct = _percentile_rank(rs_roc, n_ranked, window=PERCENTILE_WINDOW)
     
     # Rescale to center at 100
     rs_momentum_display = rs_momentum_pct + 50
@@ -121,84 +113,94 @@ def calculate_compass(prices_df: pd.DataFrame, tail_length: int = 5) -> dict:
     # =========================================================================
     # STEP 6: Build output structure
     # =========================================================================
+    # Current (last-row) values for every symbol at once
+    current_ratio_pct = rs_ratio_pct[-1]
+    current_momentum_pct = rs_momentum_pct[-1]
+    
+    # Display values (for chart, centered at 100)
+    current_ratio_display = rs_ratio_display[-1]
+    current_momentum_display = rs_momentum_display[-1]
+    
+    # Skip if NaN
+    valid = ~(np.isnan(current_ratio_pct) | np.isnan(current_momentum_pct))
+    
+    # Determine quadrant (based on 50th percentile = neutral)
+    # >50th percentile = above average
+    strong = current_ratio_pct >= 50
+    rising = current_momentum_pct >= 50
+    quadrants = np.select(
+        [strong & rising, strong & ~rising, ~strong & ~rising],
+        ['leading', 'weakening', 'lagging'],
+        default='improving',
+    ).tolist()
+    
+    # Convert percentiles to human-readable labels
+    strength_labels = _percentile_to_strength_labels(current_ratio_pct)
+    momentum_labels = _percentile_to_momentum_labels(current_momentum_pct)
+    
+    # Price info
+    current_price = prices[-1]
+    prev_price = prices[-2]
+    price_change = current_price - prev_price
+    price_change_pct = (price_change / prev_price) * 100
+    
+    # Round each output field once for all symbols
+    x_values = np.round(current_ratio_display, 1).tolist()
+    y_values = np.round(current_momentum_display, 1).tolist()
+    pct_ratios = np.round(current_ratio_pct, 1).tolist()
+    pct_momentums = np.round(current_momentum_pct, 1).tolist()
+    price_values = np.round(current_price, 2).tolist()
+    price_changes = np.round(price_change, 2).tolist()
+    price_change_pcts = np.round(price_change_pct, 2).tolist()
+    
+    # Tail points per symbol (one row per symbol, oldest point first);
+    # empty when tail_length <= 0
+    tail_rows = slice(n_ranked - max(tail_length, 0), None)
+    tail_ratio = rs_ratio_display[tail_rows]
+    tail_momentum = rs_momentum_display[tail_rows]
+    tail_x = np.round(tail_ratio, 1).T.tolist()
+    tail_y = np.round(tail_momentum, 1).T.tolist()
+    tail_valid = (~np.isnan(tail_ratio) & ~np.isnan(tail_momentum)).T.tolist()
+    
     commodities_data = []
     
-    for symbol in prices_df.columns:
-        if symbol not in COMMODITIES:
+    for col, symbol in enumerate(symbols):
+        if symbol not in COMMODITIES or not valid[col]:
             continue
             
         info = COMMODITIES[symbol]
         
-        # Get current percentile ranks (0-100 scale)
-        current_ratio_pct = rs_ratio_pct[symbol].iloc[-1]
-        current_momentum_pct = rs_momentum_pct[symbol].iloc[-1]
-        
-        # Get display values (for chart, centered at 100)
-        current_ratio_display = rs_ratio_display[symbol].iloc[-1]
-        current_momentum_display = rs_momentum_display[symbol].iloc[-1]
-        
-        # Skip if NaN
-        if pd.isna(current_ratio_pct) or pd.isna(current_momentum_pct):
-            continue
-        
-        # Determine quadrant (based on 50th percentile = neutral)
-        # >50th percentile = above average
-        if current_ratio_pct >= 50 and current_momentum_pct >= 50:
-            quadrant = 'leading'
-        elif current_ratio_pct >= 50 and current_momentum_pct < 50:
-            quadrant = 'weakening'
-        elif current_ratio_pct < 50 and current_momentum_pct < 50:
-            quadrant = 'lagging'
-        else:
-            quadrant = 'improving'
-        
-        # Convert percentiles to human-readable labels
-        strength_label = _percentile_to_strength_label(current_ratio_pct)
-        momentum_label = _percentile_to_momentum_label(current_momentum_pct)
-        
         # Get tail (historical trail for chart)
-        tail = []
-        for i in range(tail_length, 0, -1):
-            idx = -i
-            if abs(idx) <= len(rs_ratio_display):
-                ratio = rs_ratio_display[symbol].iloc[idx]
-                momentum = rs_momentum_display[symbol].iloc[idx]
-                if not pd.isna(ratio) and not pd.isna(momentum):
-                    tail.append({
-                        'x': round(float(ratio), 1),
-                        'y': round(float(momentum), 1)
-                    })
-        
-        # Get price info
-        current_price = prices_df[symbol].iloc[-1]
-        prev_price = prices_df[symbol].iloc[-2]
-        price_change = current_price - prev_price
-        price_change_pct = (price_change / prev_price) * 100
+        tail = [
+            {'x': x, 'y': y}
+            for x, y, ok in zip(tail_x[col], tail_y[col], tail_valid[col])
+            if ok
+        ]
         
         commodities_data.append({
             'symbol': symbol,
             'name': info['name'],
             'short': info.get('short', info['name']),
             'category': info['category'],
-            'quadrant': quadrant,
+            'quadrant': quadrants[col],
             
             # Chart coordinates (display values centered at 100)
-            'x': round(float(current_ratio_display), 1),
-            'y': round(float(current_momentum_display), 1),
+            'x': x_values[col],
+            'y': y_values[col],
             'tail': tail,
             
             # Percentile values (0-100, 50 = median)
-            'pct_ratio': round(float(current_ratio_pct), 1),
-            'pct_momentum': round(float(current_momentum_pct), 1),
+            'pct_ratio': pct_ratios[col],
+            'pct_momentum': pct_momentums[col],
             
             # Human-readable labels
-            'strength_label': strength_label,
-            'momentum_label': momentum_label,
+            'strength_label': strength_labels[col],
+            'momentum_label': momentum_labels[col],
             
             # Price data (can be hidden by frontend based on settings)
-            'price': round(float(current_price), 2),
-            'price_change': round(float(price_change), 2),
-            'price_change_pct': round(float(price_change_pct), 2),
+            'price': price_values[col],
+            'price_change': price_changes[col],
+            'price_change_pct': price_change_pcts[col],
         })
     
     # Sort by quadrant then by strength
@@ -206,12 +208,8 @@ def calculate_compass(prices_df: pd.DataFrame, tail_length: int = 5) -> dict:
     commodities_data.sort(key=lambda x: (quadrant_order[x['quadrant']], -x['pct_ratio']))
     
     # Summary stats
-    quadrant_counts = {
-        'leading': len([c for c in commodities_data if c['quadrant'] == 'leading']),
-        'weakening': len([c for c in commodities_data if c['quadrant'] == 'weakening']),
-        'lagging': len([c for c in commodities_data if c['quadrant'] == 'lagging']),
-        'improving': len([c for c in commodities_data if c['quadrant'] == 'improving']),
-    }
+    counts = Counter(c['quadrant'] for c in commodities_data)
+    quadrant_counts = {q: counts[q] for q in quadrant_order}
     
     return {
         'generated_at': pd.Timestamp.now().isoformat(),
@@ -229,28 +227,49 @@ def calculate_compass(prices_df: pd.DataFrame, tail_length: int = 5) -> dict:
     }
 
 
-def _percentile_to_strength_label(pct: float) -> str:
-    """Convert percentile rank (0-100) to strength label."""
-    if pct >= 80:
-        return 'very_strong'
-    elif pct >= 60:
-        return 'strong'
-    elif pct >= 40:
-        return 'neutral'
-    elif pct >= 20:
-        return 'weak'
-    else:
-        return 'very_weak'
+def _percentile_rank(values: np.ndarray, last_n: int, window: int = None,
+                     min_periods: int = 50) -> np.ndarray:
+    """
+    Calculate percentile rank (0-100) of the last `last_n` rows against their history.
+    
+    Rank = % of earlier values strictly below the current value. If window is
+    None, use all available history (expanding window); otherwise only the
+    previous `window` values. Earlier NaNs count toward the history length
+    but never rank below the current value.
+    
+    Returns an array of shape (last_n, columns); rows with fewer than
+    `min_periods` earlier values are NaN. Each step ranks one row for all
+    columns at once, so the only Python-level loop is over the ranked dates.
+    """
+    n_rows = len(values)
+    ranks = np.full((last_n, values.shape[1]), np.nan)
+    
+    for k, i in enumerate(range(n_rows - last_n, n_rows)):
+        if i < min_periods:  # Minimum data points needed for meaningful percentile
+            continue
+        start = 0 if window is None else max(0, i - window)
+        ranks[k] = (values[start:i] < values[i]).sum(axis=0) / (i - start) * 100
+    
+    return ranks
+
+
+# Percentile cut-offs and the labels between them (lowest first).
+# A percentile equal to a cut-off gets the higher label.
+_STRENGTH_BINS = np.array([20.0, 40.0, 60.0, 80.0])
+_STRENGTH_KEYS = ('very_weak', 'weak', 'neutral', 'strong', 'very_strong')
+
+_MOMENTUM_BINS = np.array([40.0, 60.0])
+_MOMENTUM_KEYS = ('fading', 'steady', 'accelerating')
+
+
+def _percentile_to_strength_labels(pcts: np.ndarray) -> list:
+    """Convert percentile ranks (0-100) to strength labels."""
+    return [_STRENGTH_KEYS[i] for i in np.searchsorted(_STRENGTH_BINS, pcts, side='right')]
 
 
-def _percentile_to_momentum_label(pct: float) -> str:
-    """Convert percentile rank (0-100) to momentum label."""
-    if pct >= 60:
-        return 'accelerating'
-    elif pct >= 40:
-        return 'steady'
-    else:
-        return 'fading'
+def _percentile_to_momentum_labels(pcts: np.ndarray) -> list:
+    """Convert percentile ranks (0-100) to momentum labels."""
+    return [_MOMENTUM_KEYS[i] for i in np.searchsorted(_MOMENTUM_BINS, pcts, side='right')]
 
 
 def get_strength_description(label: str) -> str:
@@ -29,6 +29,39 @@ TWELVE_DATA_API_KEY = os.getenv('TWELVE_DATA_API_KEY', '')
 POLYGON_API_KEY = os.getenv('POLYGON_API_KEY', '')
 
 
+# =============================================================================
+# DATA CACHE
+# =============================================================================
+# Yahoo history is cached on disk (data/cache/) per symbol and period.
+# Kept below the update interval so every scheduled run still gets fresh
+# prices; the cache only absorbs re-runs and back-to-back scripts.
+
+HISTORY_CACHE_TTL_DEFAULT = int(os.getenv('PRICE_CACHE_TTL', 10 * 60))  # seconds
+HISTORY_CACHE_TTL = {
+    '5d': HISTORY_CACHE_TTL_DEFAULT,
+    '1y': HISTORY_CACHE_TTL_DEFAULT,
+    '5d-batch': HISTORY_CACHE_TTL_DEFAULT,  # Term-structure batch downloads
+}
+
+# Expired histories are topped up with just the bars since their last date
+# until this long after their last full download, then downloaded in full
+# again (picking up Yahoo's revisions to older bars). This only helps where
+# data/cache/ survives between runs (local re-runs, or a CI cache step): it
+# is git-ignored, so a fresh checkout always downloads in full.
+HISTORY_DELTA_MAX_AGE = 24 * 60 * 60
+
+
+# =============================================================================
+# MARKET HOURS
+# =============================================================================
+# CME Globex futures trade Sunday 6pm - Friday 5pm ET, with a daily 5-6pm
+# break. While closed, scheduled runs skip the fetch once a run has
+# completed this long after the close (Yahoo quotes lag the settle).
+
+MARKET_TIMEZONE = 'America/New_York'
+MARKET_CLOSE_GRACE = 30 * 60  # seconds
+
+
 # =============================================================================
 # GROWTH THRESHOLDS
 # =============================================================================
@@ -165,6 +198,7 @@ UPGRADE_OPTIONS = {
 RS_RATIO_PERIOD = 100       # Standard: 100-period smoothing
 RS_MOMENTUM_PERIOD = 35     # Standard: 35-period rate of change
 TAIL_LENGTH = 5             # Number of historical points to show
+PERCENTILE_WINDOW = 252     # Trading days of history used for percentile ranks (~1 year)
 
 
 # =============================================================================
@@ -304,6 +338,9 @@ COMMODITIES = {
     },
 }
 
+# Fewer commodities than this with usable history aborts the update
+MIN_COMMODITIES = 10
+
 
 # =============================================================================
 # UI SETTINGS
@@ -0,0 +1,148 @@
+"""
+History Cache - TTL memory and file cache for Yahoo Finance history
+
+Lookups go memory -> file -> network. Both tiers share the per-period TTL,
+measured from when the history was last saved. An expired file whose last
+full download is younger than HISTORY_DELTA_MAX_AGE can be topped up instead
+of downloaded again in full.
+
+Each file holds {'history': DataFrame, 'full_download_at': unix time}; top-ups
+keep the original full-download time so histories are periodically rebuilt.
+"""
+
+import os
+import time
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+import pandas as pd
+from config import HISTORY_CACHE_TTL, HISTORY_CACHE_TTL_DEFAULT, HISTORY_DELTA_MAX_AGE
+
+CACHE_DIR = Path(__file__).parent.parent / 'data' / 'cache'
+
+# (symbol, period) -> (expiry time, history) for this process
+_memory = {}
+
+
+def _cache_path(symbol: str, period: str) -> Path:
+    return CACHE_DIR / f'{symbol}_{period}.pkl'
+
+
+def _ttl(period: str) -> float:
+    return HISTORY_CACHE_TTL.get(period, HISTORY_CACHE_TTL_DEFAULT)
+
+
+def load_cached(symbol: str, period: str) -> Optional[pd.DataFrame]:
+    """Return cached history for (symbol, period), or None if missing or stale."""
+    key = (symbol, period)
+    now = time.time()
+    
+    entry = _memory.get(key)
+    if entry is not None:
+        if now < entry[0]:
+            return entry[1]
+        del _memory[key]
+    
+    path = _cache_path(symbol, period)
+    try:
+        expires = path.stat().st_mtime + _ttl(period)
+    except OSError:
+        return None  # Not cached
+    if now < expires:
+        entry = _read_entry(path)
+        if entry is not None:
+            _memory[key] = (expires, entry[0])
+            return entry[0]
+    return None
+
+
+def _read_entry(path: Path) -> Optional[Tuple[pd.DataFrame, float]]:
+    """
+    Read a cache file as (history, time of its last full download).
+    
+    Returns None if the file is missing. A file that can't be read (partly
+    written, corrupt, or pickled by another pandas version) is deleted so
+    the next save replaces it, and also reads as None.
+    """
+    try:
+        entry = pd.read_pickle(path)
+        if isinstance(entry, pd.DataFrame):
+            return entry, 0.0  # Older format without a download time: rebuild
+        return entry['history'], float(entry['full_download_at'])
+    except FileNotFoundError:
+        return None
+    except Exception:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+        return None
+
+
+def load_stale(symbol: str, period: str) -> Optional[Tuple[pd.DataFrame, float]]:
+    """
+    Return the cached (history, full download time) even if expired, or None
+    if missing or last downloaded in full more than HISTORY_DELTA_MAX_AGE ago.
+    """
+    entry = _read_entry(_cache_path(symbol, period))
+    if entry is not None and time.time() - entry[1] < HISTORY_DELTA_MAX_AGE:
+        return entry
+    return None
+
+
+def save_cached(symbol: str, period: str, hist: pd.DataFrame,
+                full_download_at: Optional[float] = None):
+    """
+    Store history for (symbol, period). Empty results are not cached.
+    
+    full_download_at is when the history was last downloaded in full
+    (default now); pass the original time when saving a topped-up copy.
+    """
+    if len(hist) == 0:
+        return  # Failures are retried next time
+    
+    now = time.time()
+    _memory[(symbol, period)] = (now + _ttl(period), hist)
+    
+    entry = {
+        'history': hist,
+        'full_download_at': now if full_download_at is None else full_download_at,
+    }
+    path = _cache_path(symbol, period)
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+    pd.to_pickle(entry, tmp)
+    os.replace(tmp, path)  # Atomic, readers never see a partial file
+
+
+def cached_history(
+    symbol: str,
+    period: str,
+    fetch: Callable[[], pd.DataFrame],
+    top_up: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+) -> pd.DataFrame:
+    """
+    Return history for (symbol, period), using the cache when fresh.
+    
+    Args:
+        symbol: Yahoo symbol the history belongs to
+        period: History period ('1y', '5d', etc.)
+        fetch: Called to download the history on a cache miss
+        top_up: Optional; brings an expired cached history up to date
+            (used instead of fetch until HISTORY_DELTA_MAX_AGE after the
+            last full download)
+    
+    Returns:
+        History DataFrame (cached or freshly fetched)
+    """
+    hist = load_cached(symbol, period)
+    if hist is not None:
+        return hist
+    
+    stale = load_stale(symbol, period) if top_up is not None else None
+    if stale is not None and len(stale[0]) > 0:
+        hist = top_up(stale[0])
+        save_cached(symbol, period, hist, full_download_at=stale[1])
+    else:
+        hist = fetch()
+        save_cached(symbol, period, hist)
+    return hist
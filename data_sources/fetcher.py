@@ -2,51 +2,206 @@
 Data Fetcher - Pulls commodity prices from Yahoo Finance
 """
 
+import logging
+import sys
+import time
 import yfinance as yf
 import pandas as pd
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from config import COMMODITIES
+from config import COMMODITIES, MIN_COMMODITIES
+from data_sources.cache import cached_history, load_cached, save_cached
 
+logger = logging.getLogger(__name__)
 
-def fetch_all_prices(period: str = '1y') -> pd.DataFrame:
+# Parallel Yahoo requests per batch (kept modest to stay under rate limits)
+MAX_WORKERS = 8
+
+# Seconds before the first retry of failed symbols (doubles each retry)
+RETRY_BACKOFF = 2
+
+
+class InsufficientDataError(Exception):
+    """Too few commodities returned enough history to build the compass."""
+
+
+# History periods that can be topped up from a cached copy, and the span
+# each one covers (shorter periods are cheap to download in full)
+PERIOD_SPANS = {
+    '6mo': pd.DateOffset(months=6),
+    '1y': pd.DateOffset(years=1),
+    '2y': pd.DateOffset(years=2),
+}
+
+
+def _download_closes(yahoo_symbol: str, **history_args) -> pd.DataFrame:
+    """Download closing prices for one Yahoo symbol."""
+    # Only Close is used; skip dividend/split processing and drop OHLV
+    return yf.Ticker(yahoo_symbol).history(actions=False, **history_args).filter(['Close'])
+
+
+def _top_up_history(yahoo_symbol: str, period: str, stale: pd.DataFrame) -> pd.DataFrame:
+    """
+    Bring a cached history up to date by downloading only the bars since its
+    last date, then trim it back to the period's span.
+    """
+    last_date = stale.index[-1]
+    delta = _download_closes(yahoo_symbol, start=last_date.strftime('%Y-%m-%d'))
+    
+    hist = pd.concat([stale, delta])
+    hist = hist[~hist.index.duplicated(keep='last')]  # Latest bar wins
+    cutoff = pd.Timestamp.now(tz=hist.index.tz) - PERIOD_SPANS[period]
+    return hist[hist.index >= cutoff]
+
+
+def _fetch_history(yahoo_symbol: str, period: str) -> pd.DataFrame:
+    """Fetch closing prices for one Yahoo symbol (from the cache when fresh)."""
+    top_up = None
+    if period in PERIOD_SPANS:
+        top_up = lambda stale: _top_up_history(yahoo_symbol, period, stale)
+    
+    return cached_history(
+        yahoo_symbol, period,
+        lambda: _download_closes(yahoo_symbol, period=period),
+        top_up,
+    )
+
+
+def _fetch_histories(yahoo_symbols: list, period: str) -> dict:
+    """
+    Fetch closing prices for several Yahoo symbols with one batch download.
+    
+    Fresh cached histories are reused; only the rest are downloaded.
+    Symbols Yahoo returns nothing for map to an empty DataFrame.
+    """
+    # Batch frames have tz-naive, cross-aligned indexes unlike Ticker.history,
+    # so they are cached apart from _fetch_history's entries
+    cache_period = f'{period}-batch'
+    histories = {}
+    missing = []
+    for yahoo_symbol in dict.fromkeys(yahoo_symbols):  # Each symbol once, in order
+        hist = load_cached(yahoo_symbol, cache_period)
+        if hist is None:
+            missing.append(yahoo_symbol)
+        else:
+            histories[yahoo_symbol] = hist
+    
+    if missing:
+        data = yf.download(
+            missing, period=period, group_by='ticker',
+            auto_adjust=True, threads=True, progress=False,
+        )
+        if data.columns.nlevels == 1:  # Older yfinance flattens a single ticker
+            data = pd.concat({missing[0]: data}, axis=1)
+        
+        downloaded = set(data.columns.get_level_values(0))
+        for yahoo_symbol in missing:
+            if yahoo_symbol in downloaded:
+                # Batch rows are aligned across tickers; drop dates this one lacks
+                hist = data[yahoo_symbol].filter(['Close']).dropna()
+            else:
+                hist = pd.DataFrame()
+            save_cached(yahoo_symbol, cache_period, hist)
+            histories[yahoo_symbol] = hist
+    
+    return histories
+
+
+def _submit_histories(executor: ThreadPoolExecutor, period: str, symbols=None) -> dict:
+    """
+    Start a history fetch for each commodity (all by default) and return
+    {symbol: future}.
+    
+    Commodities that share a Yahoo symbol share one request.
+    """
+    by_yahoo = {}
+    futures = {}
+    for symbol in symbols if symbols is not None else COMMODITIES:
+        yahoo_symbol = COMMODITIES[symbol]['yahoo']
+        if yahoo_symbol not in by_yahoo:
+            by_yahoo[yahoo_symbol] = executor.submit(_fetch_history, yahoo_symbol, period)
+        futures[symbol] = by_yahoo[yahoo_symbol]
+    return futures
+
+
+def fetch_all_prices(period: str = '1y', min_tickers: int = MIN_COMMODITIES,
+                     retries: int = 2) -> pd.DataFrame:
     """
     Fetch historical prices for all commodities.
     
+    Symbols that error or come back empty are retried with exponential
+    backoff; short histories are not (they won't grow by retrying).
+    
     Args:
         period: How much history to fetch ('1y', '6mo', etc.)
+        min_tickers: Fewest commodities acceptable for the compass
+        retries: Extra attempts for failed symbols
     
     Returns:
         DataFrame with dates as index, commodity symbols as columns
+    
+    Raises:
+        InsufficientDataError: Fewer than min_tickers commodities succeeded
     """
-    print(f"Fetching {len(COMMODITIES)} commodities...")
+    logger.info("Fetching %d commodities...", len(COMMODITIES))
     
     prices = {}
     failed = []
+    pending = list(COMMODITIES)
     
-    for symbol, info in COMMODITIES.items():
-        yahoo_symbol = info['yahoo']
-        try:
-            ticker = yf.Ticker(yahoo_symbol)
-            hist = ticker.history(period=period)
-            
-            if len(hist) >= 100:  # Minimum needed for RRG calculation
-                prices[symbol] = hist['Close']
-                print(f"  ✓ {info['name']}: {len(hist)} days")
-            else:
-                print(f"  ✗ {info['name']}: only {len(hist)} days (need 100+)")
-                failed.append(symbol)
-        except Exception as e:
-            print(f"  ✗ {info['name']}: {e}")
-            failed.append(symbol)
+    for attempt in range(retries + 1):
+        if attempt:
+            delay = RETRY_BACKOFF * 2 ** (attempt - 1)
+            logger.info("\nRetrying %d commodities in %ds...", len(pending), delay)
+            time.sleep(delay)
+        
+        # Requests are I/O-bound, so issue them all at once and collect the
+        # results in config order
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = _submit_histories(executor, period, pending)
+        
+        retry = []
+        for symbol, future in futures.items():
+            info = COMMODITIES[symbol]
+            try:
+                hist = future.result()
+                
+                if len(hist) >= 100:  # Minimum needed for RRG calculation
+                    prices[symbol] = hist['Close'].dropna()
+                    logger.info("  ✓ %s: %d days", info['name'], len(hist))
+                elif len(hist) == 0:
+                    logger.warning("  ✗ %s: no data", info['name'])
+                    retry.append(symbol)
+                else:
+                    logger.warning("  ✗ %s: only %d days (need 100+)", info['name'], len(hist))
+                    failed.append(symbol)
+            except Exception as e:
+                logger.warning("  ✗ %s: %s", info['name'], e)
+                retry.append(symbol)
+        
+        pending = retry
+        if not pending:
+            break
     
+    failed = [symbol for symbol in COMMODITIES if symbol in failed or symbol in pending]
     if failed:
-        print(f"\nWarning: {len(failed)} commodities failed: {', '.join(failed)}")
+        logger.warning("\nWarning: %d commodities failed: %s", len(failed), ', '.join(failed))
+    
+    # Combine into DataFrame (config column order, whatever attempt each came
+    # from), keeping only dates where all commodities have data
+    prices = {symbol: prices[symbol] for symbol in COMMODITIES if symbol in prices}
+    if prices:
+        df = pd.concat(prices, axis=1, join='inner')
+    else:
+        df = pd.DataFrame()
     
-    # Combine into DataFrame and align dates
-    df = pd.DataFrame(prices)
-    df = df.dropna()  # Only keep dates where all commodities have data
+    logger.info("\nTotal: %d aligned trading days for %d commodities", len(df), len(df.columns))
     
-    print(f"\nTotal: {len(df)} aligned trading days for {len(df.columns)} commodities")
+    if len(df.columns) < min_tickers:
+        raise InsufficientDataError(
+            f"Only got {len(df.columns)} commodities, need at least {min_tickers}"
+        )
     
     return df
 
@@ -60,27 +215,45 @@ def fetch_latest_prices() -> dict:
     """
     results = {}
     
-    for symbol, info in COMMODITIES.items():
-        yahoo_symbol = info['yahoo']
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = _submit_histories(executor, '5d')
+    
+    # Collect the last two closes for commodities with data
+    symbols = []
+    current_prices = []
+    previous_prices = []
+    
+    for symbol, future in futures.items():
         try:
-            ticker = yf.Ticker(yahoo_symbol)
-            hist = ticker.history(period='5d')
+            hist = future.result()
             
             if len(hist) >= 2:
-                current = hist['Close'].iloc[-1]
-                previous = hist['Close'].iloc[-2]
-                change = current - previous
-                change_pct = (change / previous) * 100
-                
-                results[symbol] = {
-                    'price': round(current, 2),
-                    'change': round(change, 2),
-                    'change_pct': round(change_pct, 2),
-                    'name': info['name'],
-                    'category': info['category'],
-                }
+                current_prices.append(hist['Close'].iloc[-1])
+                previous_prices.append(hist['Close'].iloc[-2])
+                symbols.append(symbol)
         except Exception as e:
-            print(f"Error fetching {symbol}: {e}")
+            logger.warning("Error fetching %s: %s", symbol, e)
+    
+    current = np.array(current_prices, dtype=float)
+    previous = np.array(previous_prices, dtype=float)
+    change = current - previous
+    change_pct = (change / previous) * 100
+    
+    rows = zip(
+        symbols,
+        np.round(current, 2).tolist(),
+        np.round(change, 2).tolist(),
+        np.round(change_pct, 2).tolist(),
+    )
+    for symbol, price, price_change, price_change_pct in rows:
+        info = COMMODITIES[symbol]
+        results[symbol] = {
+            'price': price,
+            'change': price_change,
+            'change_pct': price_change_pct,
+            'name': info['name'],
+            'category': info['category'],
+        }
     
     return results
 
@@ -209,62 +382,93 @@ def fetch_term_structure() -> dict:
     }
     
     results = {}
-    summary = {'contango': 0, 'backwardation': 0, 'flat': 0}
     
-    print("\nFetching term structure...")
+    logger.info("\nFetching term structure...")
+    
+    # Fetch front and next month prices for all contracts in one batch
+    contracts = [config[leg] for config in term_contracts.values() for leg in ('front', 'next')]
+    try:
+        histories = _fetch_histories(contracts, '5d')
+    except Exception as e:
+        logger.warning("  ✗ Batch download failed: %.30s", e)
+        histories = {}
+    
+    # Collect the latest front/next closes for contracts with data
+    symbols = []
+    front_prices = []
+    next_prices = []
+    days_between = []
     
     for symbol, config in term_contracts.items():
         try:
-            # Fetch front and next month prices
-            front_data = yf.Ticker(config['front']).history(period='5d')
-            next_data = yf.Ticker(config['next']).history(period='5d')
+            front_data = histories.get(config['front'], pd.DataFrame())
+            next_data = histories.get(config['next'], pd.DataFrame())
             
             if len(front_data) == 0 or len(next_data) == 0:
-                print(f"  ✗ {config['name']}: Missing data")
+                logger.warning("  ✗ %s: Missing data", config['name'])
                 continue
             
-            front_price = front_data['Close'].iloc[-1]
-            next_price = next_data['Close'].iloc[-1]
-            days_between = config['days']
-            
-            # Calculate raw spread
-            raw_spread = ((next_price - front_price) / front_price) * 100
-            
-            # Annualize the spread
-            annualized_spread = ((next_price / front_price) ** (365 / days_between) - 1) * 100
-            
-            # Classify with 2% threshold (validated)
-            if annualized_spread > 2.0:
-                structure = 'contango'
-            elif annualized_spread < -2.0:
-                structure = 'backwardation'
-            else:
-                structure = 'flat'
-            
-            summary[structure] += 1
-            
-            results[symbol] = {
-                'name': config['name'],
-                'structure': structure,
-                'spread_raw': round(raw_spread, 2),
-                'spread_annualized': round(annualized_spread, 2),
-                'front_price': round(front_price, 2),
-                'next_price': round(next_price, 2),
-                'front_contract': config['front'],
-                'next_contract': config['next'],
-                'seasonal': config['seasonal'],
-            }
-            
-            # Visual indicator
-            indicator = '↗' if structure == 'contango' else '↘' if structure == 'backwardation' else '→'
-            seasonal_flag = ' ⚠️' if config['seasonal'] else ''
-            print(f"  {indicator} {config['name']}: {structure.upper()} ({annualized_spread:+.1f}% ann.){seasonal_flag}")
+            front_prices.append(front_data['Close'].iloc[-1])
+            next_prices.append(next_data['Close'].iloc[-1])
+            days_between.append(config['days'])
+            symbols.append(symbol)
             
         except Exception as e:
-            print(f"  ✗ {config['name']}: Error - {str(e)[:30]}")
+            logger.warning("  ✗ %s: Error - %.30s", config['name'], e)
+    
+    front = np.array(front_prices, dtype=float)
+    nxt = np.array(next_prices, dtype=float)
+    days = np.array(days_between, dtype=float)
+    
+    # Calculate raw spread
+    raw_spread = ((nxt - front) / front) * 100
+    
+    # Annualize the spread
+    annualized_spread = ((nxt / front) ** (365 / days) - 1) * 100
     
-    print(f"\nTerm Structure Summary:")
-    print(f"  Contango: {summary['contango']} | Backwardation: {summary['backwardation']} | Flat: {summary['flat']}")
+    # Classify with 2% threshold (validated)
+    structures = np.select(
+        [annualized_spread > 2.0, annualized_spread < -2.0],
+        ['contango', 'backwardation'],
+        default='flat',
+    )
+    
+    summary = {
+        structure: int(np.count_nonzero(structures == structure))
+        for structure in ('contango', 'backwardation', 'flat')
+    }
+    
+    # Round each column once for output
+    raw_rounded = np.round(raw_spread, 2).tolist()
+    annualized_rounded = np.round(annualized_spread, 2).tolist()
+    front_rounded = np.round(front, 2).tolist()
+    next_rounded = np.round(nxt, 2).tolist()
+    
+    for i, symbol in enumerate(symbols):
+        config = term_contracts[symbol]
+        structure = str(structures[i])
+        
+        results[symbol] = {
+            'name': config['name'],
+            'structure': structure,
+            'spread_raw': raw_rounded[i],
+            'spread_annualized': annualized_rounded[i],
+            'front_price': front_rounded[i],
+            'next_price': next_rounded[i],
+            'front_contract': config['front'],
+            'next_contract': config['next'],
+            'seasonal': config['seasonal'],
+        }
+        
+        # Visual indicator
+        indicator = '↗' if structure == 'contango' else '↘' if structure == 'backwardation' else '→'
+        seasonal_flag = ' ⚠️' if config['seasonal'] else ''
+        logger.info("  %s %s: %s (%+.1f%% ann.)%s",
+                    indicator, config['name'], structure.upper(), annualized_spread[i], seasonal_flag)
+    
+    logger.info("\nTerm Structure Summary:")
+    logger.info("  Contango: %d | Backwardation: %d | Flat: %d",
+                summary['contango'], summary['backwardation'], summary['flat'])
     
     return {
         'commodities': results,
@@ -278,6 +482,8 @@ def fetch_term_structure() -> dict:
 
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
+    
     # Test the fetcher
     print("=" * 50)
     print("Testing Data Fetcher")
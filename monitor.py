@@ -4,9 +4,15 @@ Growth Monitor
 Tracks usage metrics, checks thresholds, triggers alerts and auto-protection.
 """
 
+import atexit
+import bisect
 import json
+import orjson
 import os
+import time
+from collections import Counter
 from datetime import datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 from config import THRESHOLDS, AUTO_PROTECTION, ALERTS, UPGRADE_OPTIONS
@@ -17,34 +23,163 @@ class GrowthMonitor:
     Monitors growth metrics and takes protective actions when needed.
     """
     
+    # API calls are counted in memory and written at most this often (seconds)
+    FLUSH_INTERVAL = 30
+    
+    # Days of per-day history kept in metrics.json; older days are folded
+    # into metrics['totals'] so lifetime figures survive
+    RETENTION_DAYS = 90
+    
+    # Levels above 'ok' for each metric, least to most severe
+    # (thresholds are THRESHOLDS['<metric>_<level>'])
+    LEVELS = {
+        'visitors': ('notice', 'attention', 'warning', 'critical'),
+        'api_calls': ('notice', 'warning', 'critical'),
+        'error_rate': ('warning', 'critical'),
+    }
+    
+    # Alert raised at each level: (type, severity, message template, auto-protection actions)
+    LEVEL_ALERTS = {
+        'visitors': {
+            'critical': ('visitors_critical', 'critical',
+                         'Critical: {:.0f} daily visitors exceeds safe threshold',
+                         ('hide_prices', 'hide_percentages')),
+            'warning': ('visitors_warning', 'warning',
+                        'Warning: {:.0f} daily visitors approaching threshold', ()),
+            'attention': ('visitors_attention', 'info',
+                          'Attention: {:.0f} daily visitors - review your options', ()),
+            'notice': ('visitors_notice', 'info',
+                       'Notice: {:.0f} daily visitors - you\'re growing!', ()),
+        },
+        'api_calls': {
+            'critical': ('api_critical', 'critical',
+                         'Critical: {} API calls today - approaching limit',
+                         ('reduce_frequency',)),
+            'warning': ('api_warning', 'warning', 'Warning: {} API calls today', ()),
+        },
+        'error_rate': {
+            'critical': ('errors_critical', 'critical', 'Critical: {:.1f}% error rate', ()),
+            'warning': ('errors_warning', 'warning', 'Warning: {:.1f}% error rate', ()),
+        },
+    }
+    
     def __init__(self, data_dir: str = 'data'):
-        self.data_dir = Path(data_dir)
-        self.data_dir.mkdir(exist_ok=True)
-        self.metrics_file = self.data_dir / 'metrics.json'
-        self.status_file = self.data_dir / 'status.json'
-        self.alerts_file = self.data_dir / 'alerts.json'
+        self.data_dir, self.metrics_file, self.status_file, self.alerts_file = self._paths(data_dir)
+        self._raw = {}  # path -> (mtime_ns, file contents)
+        self._pending = Counter()  # (date, 'success'|'error') -> unsaved API calls
+        self._last_flush = time.monotonic()
+        
+        # metric -> (ascending thresholds, level names with 'ok' first)
+        self._tiers = {
+            metric: (
+                [THRESHOLDS[f'{metric}_{level}'] for level in levels],
+                ('ok',) + levels,
+            )
+            for metric, levels in self.LEVELS.items()
+        }
         
+    @staticmethod
+    @lru_cache(maxsize=8)
+    def _paths(data_dir: str) -> tuple:
+        """Create data_dir (once per process) and return it with its data file paths."""
+        path = Path(data_dir)
+        path.mkdir(exist_ok=True)
+        return path, path / 'metrics.json', path / 'status.json', path / 'alerts.json'
+    
     def load_metrics(self) -> dict:
-        """Load historical metrics."""
-        if self.metrics_file.exists():
-            with open(self.metrics_file) as f:
-                return json.load(f)
-        return {
-            'daily': {},
-            'api_calls': {},
-            'errors': {},
-        }
+        """
+        Load historical metrics, including any buffered API calls.
+        
+        Each call returns a fresh copy; changes only persist via save_metrics().
+        """
+        self.flush()
+        return self._read_metrics()
+    
+    def _read_metrics(self) -> dict:
+        """Parse metrics from disk into a fresh dict."""
+        metrics = self._read_json(self.metrics_file)
+        if metrics is None:
+            return {
+                'daily': {},
+                'api_calls': {},
+                'errors': {},
+            }
+        return metrics
+    
+    def _read_json(self, path: Path) -> Optional[dict]:
+        """
+        Parse a JSON data file into a fresh dict, or None if it doesn't exist.
+        
+        The file's bytes are reused until its mtime changes, so repeated
+        reads within a check cost a stat() and a parse instead of a file read.
+        Callers always get their own copy to modify.
+        """
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        
+        cached = self._raw.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path, 'rb') as f:
+                cached = (mtime, f.read())
+            self._raw[path] = cached
+        return orjson.loads(cached[1])
+    
+    def _write_json(self, path: Path, data: dict):
+        """Write a JSON data file and remember its contents."""
+        raw = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+        with open(path, 'wb') as f:
+            f.write(raw)
+        self._raw[path] = (path.stat().st_mtime_ns, raw)
+    
+    def flush(self):
+        """Write buffered API-call counts to the metrics file."""
+        if not self._pending:
+            return
+        
+        metrics = self._read_metrics()
+        for (date, outcome), count in self._pending.items():
+            if date not in metrics['api_calls']:
+                metrics['api_calls'][date] = {'success': 0, 'error': 0}
+            metrics['api_calls'][date][outcome] += count
+        
+        self._pending.clear()
+        atexit.unregister(self.flush)
+        self._last_flush = time.monotonic()
+        self.save_metrics(metrics)
     
     def save_metrics(self, metrics: dict):
-        """Save metrics to file."""
-        with open(self.metrics_file, 'w') as f:
-            json.dump(metrics, f, indent=2)
+        """Save metrics to file, compacting days older than RETENTION_DAYS."""
+        self._compact(metrics)
+        self._write_json(self.metrics_file, metrics)
+    
+    def _cutoff_date(self) -> str:
+        """First date (YYYY-MM-DD) still kept per day; older ones are compacted."""
+        return (datetime.now() - timedelta(days=self.RETENTION_DAYS)).strftime('%Y-%m-%d')
+    
+    def _compact(self, metrics: dict):
+        """Move per-day entries past the retention window into metrics['totals']."""
+        cutoff = self._cutoff_date()
+        old_days = [date for date in metrics['daily'] if date < cutoff]
+        old_calls = [date for date in metrics['api_calls'] if date < cutoff]
+        if not old_days and not old_calls:
+            return
+        
+        totals = metrics.setdefault('totals', {'visitors': 0, 'days': 0, 'api_calls': 0, 'errors': 0})
+        for date in old_days:
+            totals['visitors'] += metrics['daily'].pop(date)
+        totals['days'] += len(old_days)
+        for date in old_calls:
+            calls = metrics['api_calls'].pop(date)
+            totals['api_calls'] += calls['success'] + calls['error']
+            totals['errors'] += calls['error']
     
     def load_status(self) -> dict:
-        """Load current status."""
-        if self.status_file.exists():
-            with open(self.status_file) as f:
-                return json.load(f)
+        """Load current status (a fresh copy; persist changes via save_status())."""
+        status = self._read_json(self.status_file)
+        if status is not None:
+            return status
         return {
             'show_prices': True,
             'show_percentages': True,
@@ -56,85 +191,101 @@ class GrowthMonitor:
     
     def save_status(self, status: dict):
         """Save status to file."""
-        with open(self.status_file, 'w') as f:
-            json.dump(status, f, indent=2)
+        self._write_json(self.status_file, status)
     
     def record_visitors(self, count: int, date: Optional[str] = None):
-        """Record daily visitor count."""
+        """
+        Record daily visitor count.
+        
+        Dates past the retention window are ignored: they may already be
+        folded into the lifetime totals, which can't be overwritten.
+        """
         if date is None:
             date = datetime.now().strftime('%Y-%m-%d')
+        if date < self._cutoff_date():
+            return
         
         metrics = self.load_metrics()
         metrics['daily'][date] = count
         self.save_metrics(metrics)
     
     def record_api_call(self, success: bool = True, date: Optional[str] = None):
-        """Record an API call."""
+        """
+        Record an API call.
+        
+        Counted in memory; written on the next read, every FLUSH_INTERVAL
+        seconds, or at exit.
+        """
         if date is None:
             date = datetime.now().strftime('%Y-%m-%d')
         
-        metrics = self.load_metrics()
+        if not self._pending:
+            # Only hold the monitor alive at exit while it has unsaved counts
+            atexit.register(self.flush)
+        self._pending[(date, 'success' if success else 'error')] += 1
         
-        if date not in metrics['api_calls']:
-            metrics['api_calls'][date] = {'success': 0, 'error': 0}
-        
-        if success:
-            metrics['api_calls'][date]['success'] += 1
-        else:
-            metrics['api_calls'][date]['error'] += 1
-        
-        self.save_metrics(metrics)
+        if time.monotonic() - self._last_flush > self.FLUSH_INTERVAL:
+            self.flush()
     
     def get_daily_average(self, days: int = 7) -> float:
         """Get average daily visitors over past N days."""
-        metrics = self.load_metrics()
-        
-        recent = []
-        for i in range(days):
-            date = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
-            if date in metrics['daily']:
-                recent.append(metrics['daily'][date])
-        
-        if not recent:
-            return 0
-        return sum(recent) / len(recent)
+        return self._summarize(self.load_metrics(), self._recent_date_keys(days))[0]
     
     def get_api_calls_today(self) -> int:
         """Get total API calls today."""
-        metrics = self.load_metrics()
-        today = datetime.now().strftime('%Y-%m-%d')
-        
-        if today in metrics['api_calls']:
-            calls = metrics['api_calls'][today]
-            return calls['success'] + calls['error']
-        return 0
+        return self._summarize(self.load_metrics(), self._recent_date_keys(1))[1]
     
     def get_error_rate(self, days: int = 7) -> float:
         """Get error rate over past N days."""
-        metrics = self.load_metrics()
+        return self._summarize(self.load_metrics(), self._recent_date_keys(days))[2]
+    
+    @staticmethod
+    def _recent_date_keys(days: int) -> list:
+        """Date keys ('YYYY-MM-DD') for today and the previous days - 1 days."""
+        now = datetime.now()
+        return [(now - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days)]
+    
+    def _summarize(self, metrics: dict, date_keys: list) -> tuple:
+        """
+        Summarize loaded metrics over the given dates (today first) in one pass.
         
+        Returns (average daily visitors, API calls today, error rate).
+        """
+        daily = metrics['daily']
+        api_calls = metrics['api_calls']
+        visitors = []
+        calls_today = 0
         total_success = 0
         total_error = 0
         
-        for i in range(days):
-            date = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
-            if date in metrics['api_calls']:
-                total_success += metrics['api_calls'][date]['success']
-                total_error += metrics['api_calls'][date]['error']
-        
+        for date in date_keys:
+            if date in daily:
+                visitors.append(daily[date])
+            if date in api_calls:
+                calls = api_calls[date]
+                total_success += calls['success']
+                total_error += calls['error']
+                if date == date_keys[0]:
+                    calls_today = calls['success'] + calls['error']
+        
+        daily_avg = sum(visitors) / len(visitors) if visitors else 0
         total = total_success + total_error
-        if total == 0:
-            return 0
-        return total_error / total
+        error_rate = total_error / total if total else 0
+        return daily_avg, calls_today, error_rate
     
     def check_thresholds(self) -> dict:
         """
         Check all thresholds and return status report.
         Returns dict with current levels and any actions needed.
         """
-        daily_avg = self.get_daily_average()
-        api_calls = self.get_api_calls_today()
-        error_rate = self.get_error_rate()
+        metrics = self.load_metrics()
+        daily_avg, api_calls, error_rate = self._summarize(metrics, self._recent_date_keys(7))
+        
+        levels = {
+            'visitors': self._get_level(daily_avg, 'visitors'),
+            'api_calls': self._get_level(api_calls, 'api_calls'),
+            'errors': self._get_error_level(error_rate),
+        }
         
         report = {
             'timestamp': datetime.now().isoformat(),
@@ -143,117 +294,50 @@ class GrowthMonitor:
                 'api_calls_today': api_calls,
                 'error_rate_7d': round(error_rate * 100, 2),
             },
-            'levels': {
-                'visitors': self._get_level(daily_avg, 'visitors'),
-                'api_calls': self._get_level(api_calls, 'api_calls'),
-                'errors': self._get_error_level(error_rate),
-            },
+            'levels': levels,
             'alerts': [],
             'actions': [],
         }
         
-        # Check visitor thresholds
-        if daily_avg >= THRESHOLDS['visitors_critical']:
-            report['alerts'].append({
-                'type': 'visitors_critical',
-                'message': f'Critical: {daily_avg:.0f} daily visitors exceeds safe threshold',
-                'severity': 'critical',
-            })
-            if AUTO_PROTECTION['enabled']:
-                report['actions'].append('hide_prices')
-                report['actions'].append('hide_percentages')
-        
-        elif daily_avg >= THRESHOLDS['visitors_warning']:
-            report['alerts'].append({
-                'type': 'visitors_warning',
-                'message': f'Warning: {daily_avg:.0f} daily visitors approaching threshold',
-                'severity': 'warning',
-            })
-        
-        elif daily_avg >= THRESHOLDS['visitors_attention']:
-            report['alerts'].append({
-                'type': 'visitors_attention',
-                'message': f'Attention: {daily_avg:.0f} daily visitors - review your options',
-                'severity': 'info',
-            })
-        
-        elif daily_avg >= THRESHOLDS['visitors_notice']:
-            report['alerts'].append({
-                'type': 'visitors_notice',
-                'message': f'Notice: {daily_avg:.0f} daily visitors - you\'re growing!',
-                'severity': 'info',
-            })
-        
-        # Check API thresholds
-        if api_calls >= THRESHOLDS['api_calls_critical']:
+        # Raise the alert (and protective actions) for each metric's level
+        checks = (
+            ('visitors', levels['visitors'], daily_avg),
+            ('api_calls', levels['api_calls'], api_calls),
+            ('error_rate', levels['errors'], error_rate * 100),
+        )
+        for metric, level, shown in checks:
+            alert = self.LEVEL_ALERTS[metric].get(level)
+            if alert is None:
+                continue
+            alert_type, severity, template, actions = alert
             report['alerts'].append({
-                'type': 'api_critical',
-                'message': f'Critical: {api_calls} API calls today - approaching limit',
-                'severity': 'critical',
+                'type': alert_type,
+                'message': template.format(shown),
+                'severity': severity,
             })
             if AUTO_PROTECTION['enabled']:
-                report['actions'].append('reduce_frequency')
-        
-        elif api_calls >= THRESHOLDS['api_calls_warning']:
-            report['alerts'].append({
-                'type': 'api_warning',
-                'message': f'Warning: {api_calls} API calls today',
-                'severity': 'warning',
-            })
-        
-        # Check error rate
-        if error_rate >= THRESHOLDS['error_rate_critical']:
-            report['alerts'].append({
-                'type': 'errors_critical',
-                'message': f'Critical: {error_rate*100:.1f}% error rate',
-                'severity': 'critical',
-            })
-        
-        elif error_rate >= THRESHOLDS['error_rate_warning']:
-            report['alerts'].append({
-                'type': 'errors_warning',
-                'message': f'Warning: {error_rate*100:.1f}% error rate',
-                'severity': 'warning',
-            })
+                report['actions'].extend(actions)
         
         return report
     
     def _get_level(self, value: float, metric_type: str) -> str:
         """Determine level (ok/notice/attention/warning/critical) for a metric."""
-        if metric_type == 'visitors':
-            if value >= THRESHOLDS['visitors_critical']:
-                return 'critical'
-            elif value >= THRESHOLDS['visitors_warning']:
-                return 'warning'
-            elif value >= THRESHOLDS['visitors_attention']:
-                return 'attention'
-            elif value >= THRESHOLDS['visitors_notice']:
-                return 'notice'
-            return 'ok'
-        
-        elif metric_type == 'api_calls':
-            if value >= THRESHOLDS['api_calls_critical']:
-                return 'critical'
-            elif value >= THRESHOLDS['api_calls_warning']:
-                return 'warning'
-            elif value >= THRESHOLDS['api_calls_notice']:
-                return 'notice'
+        if metric_type not in self._tiers:
             return 'ok'
-        
-        return 'ok'
+        cuts, levels = self._tiers[metric_type]
+        return levels[bisect.bisect_right(cuts, value)]
     
     def _get_error_level(self, rate: float) -> str:
         """Determine level for error rate."""
-        if rate >= THRESHOLDS['error_rate_critical']:
-            return 'critical'
-        elif rate >= THRESHOLDS['error_rate_warning']:
-            return 'warning'
-        return 'ok'
+        return self._get_level(rate, 'error_rate')
     
     def execute_actions(self, actions: list) -> list:
         """
         Execute protective actions and return what was done.
         """
+        if not actions:
+            return []
+        
         status = self.load_status()
         executed = []
         
@@ -312,16 +396,14 @@ class GrowthMonitor:
         status = self.load_status()
         threshold_report = self.check_thresholds()
         
-        # Calculate totals
-        total_visitors = sum(metrics['daily'].values())
-        total_api_calls = sum(
-            d['success'] + d['error'] 
-            for d in metrics['api_calls'].values()
-        )
-        total_errors = sum(
-            d['error'] 
-            for d in metrics['api_calls'].values()
-        )
+        # Calculate totals: compacted history plus one pass over the kept days
+        totals = metrics.get('totals', {})
+        total_visitors = totals.get('visitors', 0) + sum(metrics['daily'].values())
+        total_api_calls = totals.get('api_calls', 0)
+        total_errors = totals.get('errors', 0)
+        for d in metrics['api_calls'].values():
+            total_api_calls += d['success'] + d['error']
+            total_errors += d['error']
         
         return {
             'generated_at': datetime.now().isoformat(),
@@ -330,7 +412,7 @@ class GrowthMonitor:
                 'total_api_calls': total_api_calls,
                 'total_errors': total_errors,
                 'error_rate': round(total_errors / max(total_api_calls, 1) * 100, 2),
-                'days_tracked': len(metrics['daily']),
+                'days_tracked': totals.get('days', 0) + len(metrics['daily']),
             },
             'current': threshold_report['metrics'],
             'levels': threshold_report['levels'],
@@ -473,6 +555,7 @@ if __name__ == '__main__':
         monitor.record_api_call(success=True)
     for _ in range(5):
         monitor.record_api_call(success=False)
+    monitor.flush()
     
     # Run check
     print("\nRunning monitor check...")
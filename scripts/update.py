@@ -6,26 +6,167 @@ Run by GitHub Actions every 15 minutes (or 30 if auto-reduced).
 Fetches data, calculates compass, saves JSON, and runs growth monitor.
 """
 
-import json
+import hashlib
+import logging
+import logging.handlers
+import orjson
 import os
 import sys
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 from pathlib import Path
+from typing import Optional
+from zoneinfo import ZoneInfo
 
 # Add parent directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from data_sources.fetcher import fetch_all_prices
-from calculations.rrg import calculate_compass
-from monitor import GrowthMonitor
-from config import SHOW_PRICES, SHOW_PERCENTAGES
+from config import SHOW_PRICES, SHOW_PERCENTAGES, MARKET_TIMEZONE, MARKET_CLOSE_GRACE
+
+logger = logging.getLogger(__name__)
+
+
+def market_closed_since(now: datetime) -> Optional[datetime]:
+    """
+    Start of the current futures market closure, or None while trading.
+    
+    Args:
+        now: Current time in MARKET_TIMEZONE
+    """
+    close_today = now.replace(hour=17, minute=0, second=0, microsecond=0)
+    weekday = now.weekday()  # Monday = 0
+    
+    # Weekend: Friday 5pm until Sunday 6pm
+    if (weekday == 4 and now >= close_today) or weekday == 5 or (weekday == 6 and now.hour < 18):
+        return close_today - timedelta(days=weekday - 4)
+    
+    # Daily maintenance break, Monday-Thursday 5-6pm
+    if weekday < 4 and now.hour == 17:
+        return close_today
+    
+    return None
+
+
+def read_run_record(path: Path) -> tuple:
+    """
+    Read the last completed run's record: (data fingerprint, completion time).
+    
+    Stored as '<digest> <unix time>' in the file itself, since file mtimes
+    reset on every fresh checkout. Returns (None, 0.0) if there is no record.
+    """
+    try:
+        digest, completed_at = path.read_text().split()
+        return digest, float(completed_at)
+    except (OSError, ValueError):
+        return None, 0.0
+
+
+def read_published(path: Path) -> Optional[dict]:
+    """Load the currently published compass data, or None if unreadable."""
+    try:
+        return orjson.loads(path.read_bytes())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+
+
+def visible_fields(display_settings: dict) -> dict:
+    """The display settings recorded in compass.json."""
+    return {
+        'show_prices': display_settings['show_prices'],
+        'show_percentages': display_settings['show_percentages'],
+    }
+
+
+def apply_display_settings(compass_data: dict, display_settings: dict):
+    """Record the display settings in compass_data and remove hidden fields."""
+    compass_data['display_settings'] = visible_fields(display_settings)
+    
+    hidden = set()
+    if not display_settings['show_prices']:
+        logger.info("  → Prices hidden (threshold exceeded)")
+        hidden |= {'price', 'price_change'}
+    
+    if not display_settings['show_percentages']:
+        logger.info("  → Percentages hidden (threshold exceeded)")
+        hidden.add('price_change_pct')
+    
+    if hidden:
+        # Hidden keys bound as a default so the filter reads a local frozenset
+        def strip_hidden(commodity, hidden=frozenset(hidden)):
+            return {k: v for k, v in commodity.items() if k not in hidden}
+        
+        compass_data['commodities'] = list(map(strip_hidden, compass_data['commodities']))
+
+
+def publish(compass_data: dict, output_file: Path, run_file: Path, last_digest: Optional[str]):
+    """Write compass.json (unless unchanged) and record the completed run."""
+    output_file.parent.mkdir(exist_ok=True)
+    
+    # Fingerprint everything except the timestamp, so unchanged data
+    # (weekends, after hours) doesn't rewrite and republish the file
+    content = {k: v for k, v in compass_data.items() if k != 'generated_at'}
+    digest = hashlib.blake2b(
+        orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY), digest_size=16
+    ).hexdigest()
+    if output_file.exists() and digest == last_digest:
+        logger.info("No change - skipping write")
+    else:
+        payload = orjson.dumps(compass_data, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
+        
+        # Write beside the target and swap in, so readers never see a partial file
+        tmp_file = output_file.with_suffix('.json.tmp')
+        try:
+            tmp_file.write_bytes(payload)
+            os.replace(tmp_file, output_file)
+        except BaseException:
+            tmp_file.unlink(missing_ok=True)  # Never leave a partial file in public/
+            raise
+        
+        logger.info("Saved to: %s", output_file)
+    
+    run_file.write_text(f'{digest} {time.time():.0f}')
+
+
+def run_growth_check(monitor):
+    """Check growth thresholds, apply auto-protection, and log the results."""
+    logger.info("\n" + "-" * 60)
+    logger.info("GROWTH MONITOR CHECK")
+    logger.info("-" * 60)
+    
+    report = monitor.check_thresholds()
+    
+    logger.info("  Daily visitors (avg): %s", report['metrics']['daily_visitors_avg'])
+    logger.info("  API calls today: %s", report['metrics']['api_calls_today'])
+    logger.info("  Error rate (7d): %s%%", report['metrics']['error_rate_7d'])
+    logger.info("  Levels: %s", report['levels'])
+    
+    # Execute any auto-protection actions
+    if report['actions']:
+        logger.info("\n  Auto-protection actions needed: %s", report['actions'])
+        executed = monitor.execute_actions(report['actions'])
+        for action in executed:
+            logger.info("  ✓ Executed: %s", action['action'])
+    
+    # Show alerts
+    if report['alerts']:
+        logger.info("\n  Alerts:")
+        for alert in report['alerts']:
+            severity_icon = {'info': 'ℹ️', 'warning': '⚠️', 'critical': '🛑'}.get(alert['severity'], '')
+            logger.info("    %s [%s] %s", severity_icon, alert['severity'], alert['message'])
+    else:
+        logger.info("\n  ✓ No alerts - all systems normal")
 
 
 def main():
-    print("=" * 60)
-    print("COMMODITIES TRACKER - DATA UPDATE")
-    print(f"Started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print("=" * 60)
+    logger.info("=" * 60)
+    logger.info("COMMODITIES TRACKER - DATA UPDATE")
+    logger.info("Started: %s", datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    logger.info("=" * 60)
+    
+    # Imported here so the banner is logged before pandas/numpy/yfinance load
+    from data_sources.fetcher import fetch_all_prices, InsufficientDataError
+    from calculations.rrg import calculate_compass
+    from monitor import GrowthMonitor
     
     # Initialize monitor
     monitor = GrowthMonitor(data_dir=str(Path(__file__).parent.parent / 'data'))
@@ -33,26 +174,52 @@ def main():
     # Get current display settings (may have been auto-adjusted)
     display_settings = monitor.get_display_settings()
     
+    output_file = Path(__file__).parent.parent / 'public' / 'compass.json'
+    run_file = Path(__file__).parent.parent / 'data' / 'compass.hash'
+    last_digest, last_completed = read_run_record(run_file)
+    
+    # Prices can't move while the market is closed: once a run has completed
+    # after the close, skip straight to the growth check - provided the
+    # published file still reflects the current display settings
+    closed_since = market_closed_since(datetime.now(ZoneInfo(MARKET_TIMEZONE)))
+    if closed_since is not None and last_completed >= closed_since.timestamp() + MARKET_CLOSE_GRACE:
+        published = read_published(output_file)
+        if published is not None and published.get('display_settings') == visible_fields(display_settings):
+            logger.info("\nMarket closed since %s, prices up to date - skipping fetch",
+                        closed_since.strftime('%a %H:%M %Z'))
+            run_growth_check(monitor)
+            
+            # Auto-protection only ever hides fields, so apply what it just
+            # changed to the published data rather than waiting for the open
+            display_settings = monitor.get_display_settings()
+            if published['display_settings'] != visible_fields(display_settings):
+                logger.info("\nDisplay settings changed - updating published data")
+                apply_display_settings(published, display_settings)
+                publish(published, output_file, run_file, last_digest)
+            return 0
+        
+        logger.info("\nMarket closed, but display settings changed - running full update")
+    
     # Step 1: Fetch prices
-    print("\n[1/3] Fetching price data...")
+    logger.info("\n[1/3] Fetching price data...")
     try:
         prices_df = fetch_all_prices('1y')
         monitor.record_api_call(success=True)
-    except Exception as e:
-        print(f"ERROR fetching prices: {e}")
+    except InsufficientDataError as e:
+        logger.error("ERROR: %s", e)
         monitor.record_api_call(success=False)
         sys.exit(1)
-    
-    if len(prices_df.columns) < 10:
-        print(f"ERROR: Only got {len(prices_df.columns)} commodities, need at least 10")
+    except Exception as e:
+        logger.error("ERROR fetching prices: %s", e)
+        monitor.record_api_call(success=False)
         sys.exit(1)
     
     # Step 2: Calculate Momentum Compass
-    print("\n[2/3] Calculating Momentum Compass (percentile rank method)...")
+    logger.info("\n[2/3] Calculating Momentum Compass (percentile rank method)...")
     try:
         compass_data = calculate_compass(prices_df, tail_length=5)
     except Exception as e:
-        print(f"ERROR calculating compass: {e}")
+        logger.error("ERROR calculating compass: %s", e)
         sys.exit(1)
     
     # Term structure disabled - free data sources unreliable
@@ -63,82 +230,42 @@ def main():
     }
     
     # Step 3: Add display settings to output
-    print("\n[3/3] Applying display settings and saving...")
-    compass_data['display_settings'] = {
-        'show_prices': display_settings['show_prices'],
-        'show_percentages': display_settings['show_percentages'],
-    }
-    
-    # If prices should be hidden, remove them from output
-    if not display_settings['show_prices']:
-        print("  → Prices hidden (threshold exceeded)")
-        for commodity in compass_data['commodities']:
-            del commodity['price']
-            del commodity['price_change']
-    
-    if not display_settings['show_percentages']:
-        print("  → Percentages hidden (threshold exceeded)")
-        for commodity in compass_data['commodities']:
-            if 'price_change_pct' in commodity:
-                del commodity['price_change_pct']
-    
-    # Save to JSON
-    output_dir = Path(__file__).parent.parent / 'public'
-    output_dir.mkdir(exist_ok=True)
-    
-    output_file = output_dir / 'compass.json'
-    
-    with open(output_file, 'w') as f:
-        json.dump(compass_data, f, indent=2)
-    
-    print(f"Saved to: {output_file}")
+    logger.info("\n[3/3] Applying display settings and saving...")
+    apply_display_settings(compass_data, display_settings)
+    publish(compass_data, output_file, run_file, last_digest)
     
     # Run growth monitor check
-    print("\n" + "-" * 60)
-    print("GROWTH MONITOR CHECK")
-    print("-" * 60)
-    
-    report = monitor.check_thresholds()
-    
-    print(f"  Daily visitors (avg): {report['metrics']['daily_visitors_avg']}")
-    print(f"  API calls today: {report['metrics']['api_calls_today']}")
-    print(f"  Error rate (7d): {report['metrics']['error_rate_7d']}%")
-    print(f"  Levels: {report['levels']}")
-    
-    # Execute any auto-protection actions
-    if report['actions']:
-        print(f"\n  Auto-protection actions needed: {report['actions']}")
-        executed = monitor.execute_actions(report['actions'])
-        for action in executed:
-            print(f"  ✓ Executed: {action['action']}")
-    
-    # Show alerts
-    if report['alerts']:
-        print(f"\n  Alerts:")
-        for alert in report['alerts']:
-            severity_icon = {'info': 'ℹ️', 'warning': '⚠️', 'critical': '🛑'}.get(alert['severity'], '')
-            print(f"    {severity_icon} [{alert['severity']}] {alert['message']}")
-    else:
-        print(f"\n  ✓ No alerts - all systems normal")
+    run_growth_check(monitor)
     
     # Print summary
-    print("\n" + "=" * 60)
-    print("UPDATE COMPLETE")
-    print("=" * 60)
-    print(f"Commodities: {len(compass_data['commodities'])}")
-    print(f"Data range: {compass_data['data_start'][:10]} to {compass_data['data_end'][:10]}")
-    print(f"Method: {compass_data['parameters']['normalization']}")
-    
-    print(f"\nQuadrant distribution:")
+    logger.info("\n" + "=" * 60)
+    logger.info("UPDATE COMPLETE")
+    logger.info("=" * 60)
+    logger.info("Commodities: %d", len(compass_data['commodities']))
+    logger.info("Data range: %s to %s", compass_data['data_start'][:10], compass_data['data_end'][:10])
+    logger.info("Method: %s", compass_data['parameters']['normalization'])
+    
+    logger.info("\nQuadrant distribution:")
     for quadrant, count in compass_data['summary'].items():
-        print(f"  {quadrant.capitalize():12}: {count}")
+        logger.info("  %-12s: %s", quadrant.capitalize(), count)
     
-    print(f"\nDisplay settings:")
-    print(f"  Show prices: {display_settings['show_prices']}")
-    print(f"  Show percentages: {display_settings['show_percentages']}")
+    logger.info("\nDisplay settings:")
+    logger.info("  Show prices: %s", display_settings['show_prices'])
+    logger.info("  Show percentages: %s", display_settings['show_percentages'])
     
     return 0
 
 
 if __name__ == '__main__':
-    sys.exit(main())
+    # Hold the run's log (this script and the fetcher) in memory and write
+    # it to stdout in one go; errors flush immediately
+    output = logging.handlers.MemoryHandler(
+        capacity=10000,
+        flushLevel=logging.ERROR,
+        target=logging.StreamHandler(sys.stdout),
+    )
+    logging.basicConfig(level=logging.INFO, handlers=[output])
+    try:
+        sys.exit(main())
+    finally:
+        output.flush()